@@ -1,31 +1,78 @@
 from __future__ import annotations
 
-import json
+import argparse
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, timezone
+from itertools import repeat
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
+import orjson
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from lxml import etree
+from lxml import html as lh
 
 # ---------------- CONFIG ----------------
 URL = "https://foresignal.com/en/"
 TZ = ZoneInfo("Asia/Manila")
 
 DATA_DIR = Path("data")
-DATA_DIR.mkdir(exist_ok=True)
-
 LAST_STATE_FILE = DATA_DIR / "latest_signals.json"          # last snapshot (for diff)
 TRADES_LOG_FILE = DATA_DIR / "trades_history.jsonl"         # append-only trade outcomes
+ETAG_FILE = DATA_DIR / "last_etag.json"                     # HTTP validators of last fetch
+
+# One pooled session for foresignal.com and api.telegram.org (keeps TLS alive).
+# requests adds "br" to Accept-Encoding by itself once brotli is importable.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+SESSION.headers.update({
+    "User-Agent": (
+        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+    )
+})
 
 # Foresignal obfuscation map (from site JS)
 MAP = "670429+-. 5,813"
+# Per-position lookup for decode_f: DECODE_TABLES[i][ch] == MAP[ord(ch) - 65 - i].
+# Encoded prices are ~10 chars; longer input takes the plain loop below.
+DECODE_MAX = 64
+DECODE_TABLES = tuple(
+    {chr(65 + i + k): m for k, m in enumerate(MAP)} for i in range(DECODE_MAX)
+)
 NUM_RE = re.compile(r"[-+]?\d+(?:\.\d+)?")
 F_ENC_RE = re.compile(r"f\(\s*'([^']+)'\s*\)")
 HHMM_RE = re.compile(r"hhmm\((\d+)\)")  # unix seconds inside hhmm(....)
+PIPS_RE = re.compile(r"[-+]?\d+")
+
+# row title -> Signal field ("Take profit ..." is matched by prefix)
+TITLE_TO_KEY = {
+    "Sell at": "sell_at",
+    "Buy at": "buy_at",
+    "Bought at": "bought_at",
+    "Sold at": "sold_at",
+    "Stop loss at": "stop_loss_at",
+}
+
+
+def _cls(name: str) -> str:
+    # XPath equivalent of the CSS ".name" class selector
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# Compiled once; lxml evaluates these in C without CSS->XPath translation per call
+CARD_XP = etree.XPath(f".//*[{_cls('card')} and {_cls('signal-card')}]")
+PAIR_XP = etree.XPath(f".//*[{_cls('card-header')}]//a[contains(@href, '/signals/')]")
+STATUS_XP = etree.XPath(f".//*[{_cls('signal-row')} and {_cls('signal-status')}]")
+ROW_XP = etree.XPath(f".//*[{_cls('signal-row')}]")
+TITLE_XP = etree.XPath(f".//*[{_cls('signal-title')}]")
+VALUE_XP = etree.XPath(f".//*[{_cls('signal-value')}]")
+SCRIPT_XP = etree.XPath(".//script")
+TEXT_XP = etree.XPath(".//text()[not(ancestor::script)]")
 
 # ---------------- DATA MODEL ----------------
 @dataclass
@@ -64,21 +111,71 @@ class Signal:
             "key": self.key(),
         }
 
+    @classmethod
+    def from_dict(cls, d: dict) -> Signal:
+        # inverse of to_dict (for snapshots read back from LAST_STATE_FILE)
+        return cls(
+            pair=d.get("pair", ""),
+            status=d.get("status", ""),
+            from_ts=d.get("from_ts"),
+            till_ts=d.get("till_ts"),
+            sell_at=d.get("sell_at", ""),
+            buy_at=d.get("buy_at", ""),
+            bought_at=d.get("bought_at", ""),
+            sold_at=d.get("sold_at", ""),
+            take_profit_at=d.get("take_profit_at", ""),
+            stop_loss_at=d.get("stop_loss_at", ""),
+            pips=d.get("pips"),
+        )
+
 
 # ---------------- HELPERS ----------------
-def fetch_html(url: str) -> str:
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
-            "(KHTML, like Gecko) Chrome/120.0 Safari/537.36"
-        )
-    }
-    r = requests.get(url, headers=headers, timeout=30)
-    r.raise_for_status()
-    return r.text
+def fetch_tree(url: str) -> tuple[lh.HtmlElement, dict] | None:
+    """
+    Conditional GET using the ETag / Last-Modified saved by the previous fetch.
+    Returns (tree, validators), or None when the server answers 304 (page
+    unchanged). Validators are only sent while a saved snapshot exists, and
+    the caller persists the new ones once that snapshot is up to date.
+
+    The body is streamed straight into lxml's feed parser, so parsing overlaps
+    the download and the page is never held as one big bytes/str.
+    """
+    headers = {}
+    if LAST_STATE_FILE.exists() and ETAG_FILE.exists():
+        validators = orjson.loads(ETAG_FILE.read_bytes())
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    with SESSION.get(url, headers=headers, timeout=30, stream=True) as r:
+        if r.status_code == 304:
+            return None
+        r.raise_for_status()
+
+        # a charset in the Content-Type header wins (as r.text did); otherwise
+        # libxml2 picks it up from the page's <meta>
+        if "charset=" in r.headers.get("Content-Type", ""):
+            parser = lh.HTMLParser(encoding=r.encoding)
+        else:
+            parser = lh.HTMLParser()
+        for chunk in r.iter_content(chunk_size=16384):
+            parser.feed(chunk)
+        tree = parser.close()
+
+        validators = {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+    return tree, validators
+
+
+def save_validators(validators: dict) -> None:
+    ETAG_FILE.write_bytes(orjson.dumps(validators, option=orjson.OPT_INDENT_2))
 
 
 def decode_f(encoded: str) -> str:
+    if len(encoded) <= DECODE_MAX:
+        # map() calls dict.get per char from C: no interpreted loop body
+        return "".join(map(dict.get, DECODE_TABLES, encoded, repeat(""))).strip()
+
     out = []
     for i, ch in enumerate(encoded):
         idx = ord(ch) - 65 - i
@@ -87,22 +184,46 @@ def decode_f(encoded: str) -> str:
     return "".join(out).strip()
 
 
+def first(xp: etree.XPath, el):
+    found = xp(el)
+    return found[0] if found else None
+
+
+def own_text(el) -> str:
+    # leading text node only; row titles are single-text tags,
+    # so this skips the subtree walk text_content() does
+    return (el.text or "").strip()
+
+
 def extract_value(value_el) -> str:
     # Prefer decoding <script>f('...')</script>
-    script = value_el.find("script")
-    if script:
-        m = F_ENC_RE.search(script.get_text(strip=True))
+    script = first(SCRIPT_XP, value_el)
+    if script is not None:
+        m = F_ENC_RE.search(script.text or "")
         if m:
             return decode_f(m.group(1))
 
-    # Fallback: plain numeric text
-    txt = value_el.get_text(" ", strip=True)
-    txt = re.sub(r"\s+", " ", txt).strip()
-    m = NUM_RE.search(txt)
+    # Fallback: plain numeric text (NUM_RE skips whitespace on its own)
+    m = NUM_RE.search(" ".join(TEXT_XP(value_el)))
     return m.group(0) if m else ""
 
 
-def parse_time_range(card) -> tuple[int | None, int | None]:
+def card_rows(card) -> list[tuple[str, lh.HtmlElement, lh.HtmlElement | None]]:
+    """
+    Evaluate the row/title/value XPaths once per card:
+      [(title, row, value_el), ...]
+    Rows without a title are dropped, as every consumer skips them.
+    """
+    rows = []
+    for r in ROW_XP(card):
+        title_el = first(TITLE_XP, r)
+        if title_el is None:
+            continue
+        rows.append((own_text(title_el), r, first(VALUE_XP, r)))
+    return rows
+
+
+def parse_time_range(rows) -> tuple[int | None, int | None]:
     """
     Extract From/Till unix seconds from:
       <script>w(hhmm(1769774700));</script>
@@ -112,17 +233,10 @@ def parse_time_range(card) -> tuple[int | None, int | None]:
     from_ts = None
     till_ts = None
 
-    rows = card.select(".signal-row")
-    for r in rows:
-        title_el = r.select_one(".signal-title")
-        if not title_el:
-            continue
-        title = title_el.get_text(" ", strip=True)
-
+    for title, r, _ in rows:
         if title in ("From", "Till"):
-            scripts = r.find_all("script")
-            for s in scripts:
-                m = HHMM_RE.search(s.get_text(" ", strip=True))
+            for s in SCRIPT_XP(r):
+                m = HHMM_RE.search(s.text or "")
                 if m:
                     ts = int(m.group(1))
                     if title == "From":
@@ -133,40 +247,39 @@ def parse_time_range(card) -> tuple[int | None, int | None]:
     return from_ts, till_ts
 
 
-def parse_pips(card) -> int | None:
+def parse_pips(rows) -> int | None:
     """
     Looks for:
       Profit, pips  +38
       Loss, pips    -30
     """
-    for r in card.select(".signal-row"):
-        title_el = r.select_one(".signal-title")
-        value_el = r.select_one(".signal-value")
-        if not title_el or not value_el:
+    for title, _, value_el in rows:
+        if value_el is None:
             continue
-        title = title_el.get_text(" ", strip=True)
         if title in ("Profit, pips", "Loss, pips"):
             v = extract_value(value_el)
-            m = re.search(r"[-+]?\d+", v)
+            m = PIPS_RE.search(v)
             return int(m.group(0)) if m else None
     return None
 
 
-def parse_signals(html: str) -> list[Signal]:
-    soup = BeautifulSoup(html, "html.parser")
+def parse_signals(tree: lh.HtmlElement) -> list[Signal]:
     signals: list[Signal] = []
 
-    for card in soup.select(".card.signal-card"):
-        pair_el = card.select_one(".card-header a[href*='/signals/']")
-        if not pair_el:
+    for card in CARD_XP(tree):
+        pair_el = first(PAIR_XP, card)
+        if pair_el is None:
             continue
-        pair = pair_el.get_text(strip=True)
+        # like get_text(strip=True): the anchor may wrap icons around the name
+        pair = "".join(t.strip() for t in TEXT_XP(pair_el))
 
-        status_el = card.select_one(".signal-row.signal-status")
-        status = status_el.get_text(strip=True) if status_el else ""
+        status_el = first(STATUS_XP, card)
+        # like get_text(strip=True): stripped strings, joined, <script> text excluded
+        status = "".join(t.strip() for t in TEXT_XP(status_el)) if status_el is not None else ""
 
-        from_ts, till_ts = parse_time_range(card)
-        pips = parse_pips(card)
+        rows = card_rows(card)
+        from_ts, till_ts = parse_time_range(rows)
+        pips = parse_pips(rows)
 
         # defaults
         fields = {
@@ -178,27 +291,15 @@ def parse_signals(html: str) -> list[Signal]:
             "stop_loss_at": "",
         }
 
-        for r in card.select(".signal-row"):
-            title_el = r.select_one(".signal-title")
-            value_el = r.select_one(".signal-value")
-            if not title_el or not value_el:
+        for title, _, value_el in rows:
+            if value_el is None:
                 continue
 
-            title = title_el.get_text(" ", strip=True)
-            value = extract_value(value_el)
-
-            if title == "Sell at":
-                fields["sell_at"] = value
-            elif title == "Buy at":
-                fields["buy_at"] = value
-            elif title == "Bought at":
-                fields["bought_at"] = value
-            elif title == "Sold at":
-                fields["sold_at"] = value
-            elif title.startswith("Take profit"):
-                fields["take_profit_at"] = value
-            elif title == "Stop loss at":
-                fields["stop_loss_at"] = value
+            key = TITLE_TO_KEY.get(title) or (
+                "take_profit_at" if title.startswith("Take profit") else None
+            )
+            if key:
+                fields[key] = extract_value(value_el)
 
         signals.append(
             Signal(
@@ -220,17 +321,15 @@ def parse_signals(html: str) -> list[Signal]:
     return sorted(signals, key=lambda s: (s.pair, s.from_ts or 0, s.till_ts or 0))
 
 
-def load_previous() -> list[dict] | None:
+def load_previous() -> bytes | None:
+    # raw bytes so an unchanged snapshot can be detected without parsing it
     if not LAST_STATE_FILE.exists():
         return None
-    return json.loads(LAST_STATE_FILE.read_text(encoding="utf-8"))
+    return LAST_STATE_FILE.read_bytes()
 
 
-def save_current(signals: list[Signal]) -> None:
-    LAST_STATE_FILE.write_text(
-        json.dumps([s.to_dict() for s in signals], indent=2),
-        encoding="utf-8"
-    )
+def save_current(current_raw: bytes) -> None:
+    LAST_STATE_FILE.write_bytes(current_raw)
 
 
 def now_unix() -> int:
@@ -255,42 +354,51 @@ def pl_emoji(pips: int | None) -> str:
 
 
 # ---------------- TRADE HISTORY / WIN RATE ----------------
-def append_trade_outcome(signal: Signal) -> None:
+def append_trade_outcomes(signals: list[Signal]) -> None:
     """
     Only log trades when pips is known (Filled with Profit/Loss pips on page).
     Avoid duplicates by tracking keys we've already logged.
+    The log is scanned once and opened for append once per run.
     """
-    if signal.pips is None:
+    closed = [s for s in signals if s.pips is not None]
+    if not closed:
         return
 
     # Build a set of already logged keys (lightweight scan)
     logged_keys = set()
     if TRADES_LOG_FILE.exists():
-        with TRADES_LOG_FILE.open("r", encoding="utf-8") as f:
+        with TRADES_LOG_FILE.open("rb") as f:
             for line in f:
                 try:
-                    obj = json.loads(line)
+                    obj = orjson.loads(line)
                     k = obj.get("key")
                     if k:
                         logged_keys.add(k)
                 except Exception:
                     continue
 
-    k = signal.key()
-    if k in logged_keys:
-        return
+    logged_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    lines = []
+    for signal in closed:
+        k = signal.key()
+        if k in logged_keys:
+            continue
+        logged_keys.add(k)
+
+        entry = {
+            "key": k,
+            "pair": signal.pair,
+            "from_ts": signal.from_ts,
+            "till_ts": signal.till_ts,
+            "status": signal.status,
+            "pips": signal.pips,
+            "logged_at_utc": logged_at,
+        }
+        lines.append(orjson.dumps(entry) + b"\n")
 
-    entry = {
-        "key": k,
-        "pair": signal.pair,
-        "from_ts": signal.from_ts,
-        "till_ts": signal.till_ts,
-        "status": signal.status,
-        "pips": signal.pips,
-        "logged_at_utc": datetime.now(timezone.utc).isoformat(timespec="seconds"),
-    }
-    with TRADES_LOG_FILE.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(entry) + "\n")
+    if lines:
+        with TRADES_LOG_FILE.open("ab") as f:
+            f.writelines(lines)
 
 
 def compute_win_rate() -> tuple[str, dict]:
@@ -305,10 +413,10 @@ def compute_win_rate() -> tuple[str, dict]:
     if not TRADES_LOG_FILE.exists():
         return "No closed trades yet.", per_pair
 
-    with TRADES_LOG_FILE.open("r", encoding="utf-8") as f:
+    with TRADES_LOG_FILE.open("rb") as f:
         for line in f:
             try:
-                obj = json.loads(line)
+                obj = orjson.loads(line)
             except Exception:
                 continue
             pair = obj.get("pair")
@@ -348,18 +456,30 @@ TRACK_FIELDS = [
     "pips",
 ]
 
+# price fields shown for a new signal, in display order
+VALUE_LABELS = (
+    ("Sell at", "sell_at"),
+    ("Buy at", "buy_at"),
+    ("Bought at", "bought_at"),
+    ("Sold at", "sold_at"),
+    ("TP", "take_profit_at"),
+    ("SL", "stop_loss_at"),
+)
+
+
 def index_by_key(items: list[dict]) -> dict[str, dict]:
     return {it["key"]: it for it in items if "key" in it}
 
 
-def build_change_report(prev: list[dict] | None, cur: list[Signal]) -> tuple[bool, str]:
+def build_change_report(
+    prev: list[dict] | None, cur: list[Signal], cur_list: list[dict]
+) -> tuple[bool, str]:
     """
     Returns:
       (changed?, telegram_html_text)
     """
     pulled_at = datetime.now(TZ).strftime("%Y-%m-%d %H:%M")
 
-    cur_list = [s.to_dict() for s in cur]
     if prev is None:
         # first run => treat as change and send snapshot
         text = build_full_snapshot(cur, pulled_at, prefix="🆕 First snapshot")
@@ -489,14 +609,7 @@ def format_new_signal(new: dict) -> str:
     lines.append(f"From: <code>{fmt_time(new.get('from_ts'))}</code>")
     lines.append(f"Till: <code>{fmt_time(new.get('till_ts'))}</code>")
 
-    for label, key in [
-        ("Sell at", "sell_at"),
-        ("Buy at", "buy_at"),
-        ("Bought at", "bought_at"),
-        ("Sold at", "sold_at"),
-        ("TP", "take_profit_at"),
-        ("SL", "stop_loss_at"),
-    ]:
+    for label, key in VALUE_LABELS:
         v = new.get(key) or ""
         if v:
             lines.append(f"{label}: <code>{v}</code>")
@@ -576,7 +689,7 @@ def send_telegram_html(text: str) -> None:
 
     url = f"https://api.telegram.org/bot{token}/sendMessage"
     for chunk in chunks:
-        r = requests.post(
+        r = SESSION.post(
             url,
             json={
                 "chat_id": chat_id,
@@ -590,42 +703,82 @@ def send_telegram_html(text: str) -> None:
 
 
 # ---------------- MAIN ----------------
-def main() -> None:
-    html = fetch_html(URL)
-    signals = parse_signals(html)
+def main(argv: list[str] | None = None) -> None:
+    ap = argparse.ArgumentParser(description="Scrape foresignal.com and alert on signal changes.")
+    ap.add_argument(
+        "--no-telegram",
+        action="store_true",
+        help="update the data files and print the report, but do not send it",
+    )
+    args = ap.parse_args(argv)
+
+    DATA_DIR.mkdir(exist_ok=True)
+
+    fetched = fetch_tree(URL)
+    if fetched is None:
+        # 304: the page still matches the saved snapshot. Skip download and
+        # parse, but run the snapshot through the diff so expiries still fire.
+        print("Page not modified — checking saved snapshot for expiries.")
+        validators = None
+        signals = [Signal.from_dict(d) for d in orjson.loads(LAST_STATE_FILE.read_bytes())]
+    else:
+        tree, validators = fetched
+        signals = parse_signals(tree)
+    # serialised once; shared by the diff, the state file and the daily json
+    current = [s.to_dict() for s in signals]
 
     # log outcomes (for win-rate)
-    for s in signals:
-        append_trade_outcome(s)
+    append_trade_outcomes(signals)
+
+    current_raw = orjson.dumps(current, option=orjson.OPT_INDENT_2)
 
-    prev = load_previous()
+    prev_raw = load_previous()
+    if prev_raw is None:
+        prev = None
+    elif prev_raw == current_raw:
+        # same bytes as last run: nothing to diff, only expiries can fire
+        prev = current
+    else:
+        prev = orjson.loads(prev_raw)
 
-    changed, report = build_change_report(prev, signals)
+    changed, report = build_change_report(prev, signals, current)
     if not changed:
+        # saved snapshot already matches this page, so its validators are safe to keep
+        if validators is not None:
+            save_validators(validators)
         print("No change detected — Telegram not sent.")
         return
 
-    # Save current snapshot
-    save_current(signals)
-
     # Also save daily json snapshot (optional)
     now = datetime.now(TZ)
     daily_json = DATA_DIR / f"foresignal_signals_{now.strftime('%Y-%m-%d')}.json"
-    daily_json.write_text(
-        json.dumps(
-            {
-                "source": "foresignal.com",
-                "pulled_at": now.isoformat(timespec="seconds"),
-                "signals": [s.to_dict() for s in signals],
-            },
-            indent=2,
-        ),
-        encoding="utf-8",
+    daily_raw = orjson.dumps(
+        {
+            "source": "foresignal.com",
+            "pulled_at": now.isoformat(timespec="seconds"),
+            "signals": current,
+        },
+        option=orjson.OPT_INDENT_2,
     )
 
-    # Send Telegram (only because change/expired happened)
-    send_telegram_html(report)
-    print("Telegram sent.")
+    # Snapshot writes and the Telegram send (only because change/expired
+    # happened) are independent I/O: run them side by side
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        jobs = [
+            pool.submit(save_current, current_raw),
+            pool.submit(daily_json.write_bytes, daily_raw),
+        ]
+        if not args.no_telegram:
+            jobs.append(pool.submit(send_telegram_html, report))
+    for job in jobs:
+        job.result()  # re-raise any failure
+
+    # only now does latest_signals.json reflect the page these validators describe
+    if validators is not None:
+        save_validators(validators)
+
+    if not args.no_telegram:
+        print("Telegram sent.")
     print(report)
 
 